@@ -0,0 +1,52 @@
+"""
+Build helpers.
+    python build.py ui       Compile resources/main.ui and resources/images.qrc to Python modules
+    python build.py profile  Show the slowest imports when starting the window
+"""
+import subprocess
+import sys
+
+UI_FILE = "resources/main.ui"
+UI_MODULE = "ui_main.py"
+QRC_FILE = "resources/images.qrc"
+QRC_MODULE = "images_rc.py"
+
+
+def compile_ui() -> None:
+    """
+    Compile the UI and the resources, so window.py doesn't parse them at runtime.
+    :return: None
+    """
+    subprocess.run([sys.executable, "-m", "PyQt5.uic.pyuic", UI_FILE, "-o", UI_MODULE], check=True)
+    subprocess.run([sys.executable, "-m", "PyQt5.pyrcc_main", QRC_FILE, "-o", QRC_MODULE], check=True)
+    print(f"Generated {UI_MODULE} and {QRC_MODULE}")
+
+
+def profile_imports(limit: int = 20) -> None:
+    """
+    Print the slowest imports of window.py (python -X importtime), sorted by cumulative time.
+    :param limit: number of imports to show
+    :return: None
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import window"],
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+    imports = []
+    for line in result.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        fields = line.split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        imports.append((int(fields[1]), fields[2].rstrip()))
+
+    imports.sort(reverse=True)
+    for cumulative, name in imports[:limit]:
+        print(f"{cumulative / 1000:10.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    commands = {"ui": compile_ui, "profile": profile_imports}
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        print(f"Usage: python {sys.argv[0]} [{' | '.join(commands)}]")
+        sys.exit(1)
+    commands[sys.argv[1]]()
@@ -1,8 +1,7 @@
 import os
 import sys
-import threading
 from pathlib import Path
-from typing import Union, Any, Callable
+from typing import Union, Any
 
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QPixmap
@@ -15,6 +14,8 @@ def resource_path(relative_path: Union[str, Path]) -> str:
     :param relative_path: path to resource
     :return: str
     """
+    if str(relative_path).startswith(":/"):  # Compiled Qt resource
+        return str(relative_path)
     if hasattr(sys, '_MEIPASS'):
         return os.path.join(sys._MEIPASS, relative_path)
     return os.path.join(os.path.abspath("."), relative_path)
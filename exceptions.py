@@ -5,6 +5,7 @@ class Exit(Exception):
     KeyFailedToSave = 1
     DirectoryNotFound = 2
     KeyModeError = 3
+    SameDirectory = 4
 
     def __init__(self, exitcode):
         self.exitcode = exitcode
@@ -1,12 +1,113 @@
+import base64
+import functools
 import glob
 import os
+import struct
+import time
 from pathlib import Path
 from typing import Union
 
 from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 
 from exceptions import Exit
 
+# Key derivation functions supported for passphrase-based keys
+KDF_SCRYPT = 1
+KDF_PBKDF2 = 2
+
+# Default KDF costs: scrypt "n" (power of two) and PBKDF2 iterations
+DEFAULT_COST = {KDF_SCRYPT: 2 ** 15, KDF_PBKDF2: 390000}
+# Highest accepted costs, so a damaged header can't exhaust the memory or hang the process
+MAX_COST = {KDF_SCRYPT: 2 ** 20, KDF_PBKDF2: 10000000}
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_SIZE = 16
+
+# Header written before the Fernet token of passphrase-encrypted files:
+# magic, kdf, cost, scrypt r, scrypt p, salt
+HEADER_MAGIC = b"SCX1"
+HEADER_FORMAT = ">4sBIBB%ds" % SALT_SIZE
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Loaded key files, indexed by absolute path -> (size, mtime, key)
+_key_file_cache = {}
+
+
+@functools.lru_cache(maxsize=32)
+def _derive_key(passphrase: bytes, salt: bytes, kdf: int, cost: int, r: int, p: int) -> bytes:
+    """
+    Run the KDF and return a Fernet key. Results are cached for the whole process,
+    so a bulk job or a GUI session only pays the derivation cost once per salt.
+    """
+    if kdf == KDF_SCRYPT:
+        derivator = Scrypt(salt=salt, length=32, n=cost, r=r, p=p, backend=default_backend())
+    elif kdf == KDF_PBKDF2:
+        derivator = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=cost,
+                               backend=default_backend())
+    else:
+        raise Exit(Exit.KeyModeError)
+
+    return base64.urlsafe_b64encode(derivator.derive(passphrase))
+
+
+def valid_kdf_params(kdf: int, cost: int, r: int = SCRYPT_R, p: int = SCRYPT_P) -> bool:
+    """
+    Return True if the KDF parameters are supported and within the cost limits.
+    :param kdf: KDF_SCRYPT or KDF_PBKDF2
+    :param cost: scrypt "n" or PBKDF2 iterations
+    :param r: scrypt block size
+    :param p: scrypt parallelization
+    :return: bool
+    """
+    if kdf not in DEFAULT_COST or r != SCRYPT_R or p != SCRYPT_P or not 1 < cost <= MAX_COST[kdf]:
+        return False
+    if kdf == KDF_SCRYPT and cost & (cost - 1):  # n must be a power of two
+        return False
+    return True
+
+
+def clear_key_cache() -> None:
+    """
+    Forget every derived and loaded key kept in memory.
+    :return: None
+    """
+    _derive_key.cache_clear()
+    _key_file_cache.clear()
+
+
+def calibrate_kdf(target_time: float = 0.5, kdf: int = KDF_SCRYPT) -> int:
+    """
+    Return the KDF cost that takes about target_time seconds on this machine.
+    For scrypt the cost is the "n" parameter (a power of two), for PBKDF2 the number of iterations.
+    :param target_time: desired derivation time in seconds
+    :param kdf: KDF_SCRYPT or KDF_PBKDF2
+    :return: int
+    """
+    salt = os.urandom(SALT_SIZE)
+
+    def measure(cost: int) -> float:
+        start = time.perf_counter()
+        _derive_key.__wrapped__(b"calibration", salt, kdf, cost, SCRYPT_R, SCRYPT_P)
+        return time.perf_counter() - start
+
+    if kdf == KDF_SCRYPT:
+        # Double n while the derivation stays under the target (capped at 1 GiB of memory)
+        cost = 2 ** 14
+        while cost < MAX_COST[KDF_SCRYPT] and measure(cost * 2) <= target_time:
+            cost *= 2
+        return cost
+
+    if kdf == KDF_PBKDF2:
+        # PBKDF2 scales linearly with the number of iterations
+        sample = 100000
+        return min(MAX_COST[KDF_PBKDF2], max(sample, int(sample * target_time / measure(sample))))
+
+    raise Exit(Exit.KeyModeError)
+
 
 class Secauax:
     """
@@ -18,6 +119,8 @@ class Secauax:
         Init method
         """
         self.key_ = Fernet.generate_key()
+        self.passphrase_ = None  # Set by set_passphrase()
+        self.header_ = None  # Header prepended to files encrypted with the passphrase
 
     def __str__(self):
         return self.key.decode()
@@ -27,19 +130,31 @@ class Secauax:
 
     @property
     def key(self):
+        if self.key_ is None:
+            # Passphrase key, derived the first time it's needed
+            _, kdf, cost, r, p, salt = struct.unpack(HEADER_FORMAT, self.header_)
+            self.key_ = _derive_key(self.passphrase_, salt, kdf, cost, r, p)
         return self.key_
 
     @staticmethod
     def load_key(path: Union[Path, str]) -> bytes:
         """
         Return a key from a file. This key must be valid, otherwise, an error will be thrown.
+        The key is cached in memory until the file is modified.
         :param path: path to key
         :return: bytes
         """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        cached = _key_file_cache.get(path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+
         with open(path, "rb") as filekey:
             key = filekey.read()
             filekey.close()
 
+        _key_file_cache[path] = (stat.st_size, stat.st_mtime_ns, key)
         return key
 
     def load_key_into_class(self, path: Union[Path, str]):
@@ -49,8 +164,39 @@ class Secauax:
         :return: bytes
         """
         self.key_ = Secauax.load_key(path)
+        self.passphrase_ = None
+        self.header_ = None
         return self.key
 
+    def set_passphrase(self,
+                       passphrase: Union[bytes, str],
+                       kdf: int = KDF_SCRYPT,
+                       cost: int = None,
+                       salt: bytes = None) -> None:
+        """
+        Derive the key from a passphrase instead of using a key file.
+        The salt is stored in the header of every file this instance encrypts,
+        so the same passphrase can decrypt them later. The key is only derived when it's first needed
+        (decrypting uses the salt of each file instead).
+        :param passphrase: passphrase to derive the key from
+        :param kdf: KDF_SCRYPT or KDF_PBKDF2
+        :param cost: KDF cost (see calibrate_kdf), the default value is used if not specified
+        :param salt: salt of SALT_SIZE bytes, a new one is generated if not specified.
+        Reuse a salt to hit the key cache across instances (e.g. during a GUI session)
+        :return: None
+        """
+        cost = cost if cost else DEFAULT_COST.get(kdf)
+        if not valid_kdf_params(kdf, cost) or (salt is not None and len(salt) != SALT_SIZE):
+            raise Exit(Exit.KeyModeError)
+
+        if isinstance(passphrase, str):
+            passphrase = passphrase.encode()
+        salt = salt if salt else os.urandom(SALT_SIZE)
+
+        self.passphrase_ = passphrase
+        self.header_ = struct.pack(HEADER_FORMAT, HEADER_MAGIC, kdf, cost, SCRYPT_R, SCRYPT_P, salt)
+        self.key_ = None
+
     def save_key(self, filename: Union[Path, str]) -> Union[bool, Exit]:
         """
         Save set key to a file. You can choose the file extension, although the ".key" extension is recommended.
@@ -84,6 +230,8 @@ class Secauax:
 
         # Encrypt the file
         encrypted_data = fernet.encrypt(original_file)
+        if self.header_:
+            encrypted_data = self.header_ + encrypted_data
 
         destination = filename if filename else path
         with open(destination, "wb") as encrypted_file:
@@ -133,14 +281,24 @@ class Secauax:
         :param filename: path to save the decrypted file
         :return: bytes
         """
-        fernet = Fernet(self.key)
-
         # Open original file
         with open(path, "rb") as encrypted_file:
             encrypted_data = encrypted_file.read()
             encrypted_file.close()
 
-        # Encrypt the file
+        if encrypted_data.startswith(HEADER_MAGIC):
+            # Passphrase-encrypted file: derive the key with the salt and parameters of its header
+            if self.passphrase_ is None or len(encrypted_data) < HEADER_SIZE:
+                raise InvalidToken
+            _, kdf, cost, r, p, salt = struct.unpack(HEADER_FORMAT, encrypted_data[:HEADER_SIZE])
+            if not valid_kdf_params(kdf, cost, r, p):  # Damaged or unsupported header
+                raise InvalidToken
+            fernet = Fernet(_derive_key(self.passphrase_, salt, kdf, cost, r, p))
+            encrypted_data = encrypted_data[HEADER_SIZE:]
+        else:
+            fernet = Fernet(self.key)
+
+        # Decrypt the file
         decrypted_data = fernet.decrypt(encrypted_data)
 
         destination = filename if filename else path
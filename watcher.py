@@ -0,0 +1,320 @@
+"""
+Watch-folder daemon: encrypt every new file dropped into a directory.
+Usage: python watcher.py INPUT_DIRECTORY OUTPUT_DIRECTORY (--key KEY_FILE | --passphrase) [--remove-original]
+"""
+import argparse
+import contextlib
+import ctypes
+import ctypes.util
+import fnmatch
+import getpass
+import logging
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Union
+
+from cryptography.fernet import Fernet
+
+from exceptions import Exit
+from secauax import Secauax
+
+logger = logging.getLogger("secauax.watcher")
+
+# inotify flags (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+IN_EVENT_FORMAT = "iIII"  # wd, mask, cookie, len
+IN_EVENT_SIZE = struct.calcsize(IN_EVENT_FORMAT)
+
+
+class FolderWatcher:
+    """
+    Watch a directory and encrypt new or modified files into another directory.
+    Uses inotify on Linux and falls back to polling elsewhere.
+    """
+
+    def __init__(self,
+                 secauax: Secauax,
+                 input_directory: Union[Path, str],
+                 output_directory: Union[Path, str],
+                 file_extension: str = "*",
+                 remove_original: bool = False,
+                 settle_time: float = 2.0,
+                 poll_interval: float = 1.0,
+                 batch_size: int = 32,
+                 workers: int = None):
+        """
+        Init method
+        :param secauax: Secauax instance with the key (or passphrase) to encrypt with
+        :param input_directory: directory to watch
+        :param output_directory: directory to save the encrypted files, it must be a different directory
+        :param file_extension: filter files by extension: "*.png" / "*.txt" / ...
+        :param remove_original: remove the plaintext file once it is encrypted
+        :param settle_time: seconds without changes before a file is considered completely written.
+        With inotify, the file must also have been closed (or moved into the directory)
+        :param poll_interval: seconds between checks (directory scans when polling)
+        :param batch_size: maximum number of files sent to the worker pool at once
+        :param workers: number of worker threads, defaults to the number of CPUs
+        """
+        if not os.path.isdir(input_directory) or not os.path.isdir(output_directory):
+            raise Exit(Exit.DirectoryNotFound)
+        if os.path.samefile(input_directory, output_directory):
+            raise Exit(Exit.SameDirectory)
+
+        self.secauax = secauax
+        self.input_directory = os.path.abspath(input_directory)
+        self.output_directory = os.path.abspath(output_directory)
+        self.file_extension = file_extension
+        self.remove_original = remove_original
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.workers = workers if workers else os.cpu_count() or 1
+
+        # Files waiting to settle, indexed by path -> (time of the last change, closed for writing)
+        self.pending = {}
+        self.snapshot = {}  # Polling mode: path -> (size, mtime)
+        self.inotify_fd = None
+        self.stop_event = threading.Event()
+
+    def stop(self) -> None:
+        """
+        Stop the run() loop. Files being encrypted are finished first.
+        :return: None
+        """
+        self.stop_event.set()
+
+    def run(self) -> None:
+        """
+        Watch the directory until stop() is called.
+        Files already in the directory that have no up-to-date encrypted copy are encrypted too.
+        :return: None
+        """
+        try:
+            self.inotify_fd = FolderWatcher.inotify_open(self.input_directory)
+            logger.info(f"Watching {self.input_directory} with inotify")
+        except OSError:
+            self.inotify_fd = None
+            logger.info(f"Watching {self.input_directory} by polling every {self.poll_interval}s")
+
+        self.scan(check_output=True)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                while not self.stop_event.is_set():
+                    if self.inotify_fd is not None:
+                        self.read_events()
+                    else:
+                        self.stop_event.wait(self.poll_interval)
+                        self.scan()
+
+                    for batch in self.ready_batches():
+                        # Wait for each batch, so the plaintext is never picked up twice
+                        list(executor.map(self.encrypt, batch))
+        finally:
+            if self.inotify_fd is not None:
+                os.close(self.inotify_fd)
+                self.inotify_fd = None
+
+    @staticmethod
+    def inotify_open(directory: str) -> int:
+        """
+        Return an inotify file descriptor watching the directory. An OSError is raised if inotify is not available.
+        :param directory: directory to watch
+        :return: int
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        if libc.inotify_add_watch(fd, os.fsencode(directory), IN_WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, os.strerror(errno))
+
+        return fd
+
+    def read_events(self) -> None:
+        """
+        Wait up to poll_interval for inotify events and mark the changed files as pending.
+        :return: None
+        """
+        readable, _, _ = select.select([self.inotify_fd], [], [], self.poll_interval)
+        if not readable:
+            return
+
+        try:
+            data = os.read(self.inotify_fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        now = time.monotonic()
+        offset = 0
+        while offset + IN_EVENT_SIZE <= len(data):
+            _, mask, _, length = struct.unpack_from(IN_EVENT_FORMAT, data, offset)
+            name = data[offset + IN_EVENT_SIZE:offset + IN_EVENT_SIZE + length].rstrip(b"\0")
+            offset += IN_EVENT_SIZE + length
+
+            if mask & IN_Q_OVERFLOW:  # Events were lost, check the whole directory
+                self.scan(check_output=True)
+            elif name and not mask & IN_ISDIR:
+                path = os.path.join(self.input_directory, os.fsdecode(name))
+                if fnmatch.fnmatch(os.path.basename(path), self.file_extension):
+                    # Only a closed (or moved in) file can be ready, other events just reset the timer
+                    self.pending[path] = (now, bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO)))
+
+    def scan(self, check_output: bool = False) -> None:
+        """
+        Scan the directory and mark new or modified files as pending.
+        :param check_output: only mark the files without an up-to-date encrypted copy instead of comparing
+        with the last scan (used at startup and when inotify events were lost)
+        :return: None
+        """
+        now = time.monotonic()
+        snapshot = {}
+        for entry in os.scandir(self.input_directory):
+            if not entry.is_file() or not fnmatch.fnmatch(entry.name, self.file_extension):
+                continue
+
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+
+            if check_output:
+                changed = self.needs_encryption(entry.path)
+            else:
+                changed = self.snapshot.get(entry.path) != snapshot[entry.path]
+
+            if changed:
+                # Scans can't tell if a file is still open, it's ready once it stops changing
+                self.pending[entry.path] = (now, True)
+
+        self.snapshot = snapshot
+
+    def ready_batches(self) -> List[List[str]]:
+        """
+        Return the pending files that haven't changed for settle_time seconds, split in batches.
+        :return: list
+        """
+        now = time.monotonic()
+        ready = [path for path, (changed, closed) in self.pending.items()
+                 if closed and now - changed >= self.settle_time]
+        for path in ready:
+            del self.pending[path]
+
+        return [ready[i:i + self.batch_size] for i in range(0, len(ready), self.batch_size)]
+
+    def needs_encryption(self, path: str) -> bool:
+        """
+        Return True if the file has no encrypted copy, or the copy is older than the file.
+        :param path: path to the original file
+        :return: bool
+        """
+        destination = os.path.join(self.output_directory, os.path.basename(path))
+        try:
+            return os.path.getmtime(destination) < os.path.getmtime(path)
+        except FileNotFoundError:
+            return True
+
+    def encrypt(self, path: str) -> bool:
+        """
+        Encrypt a file into the output directory. The encrypted file is written to a temporary file first,
+        so the output directory never contains partial files. The original is only removed if it didn't change
+        while it was being encrypted. Errors are logged and never stop the watcher.
+        Return True if the file was encrypted.
+        :param path: path to the original file
+        :return: bool
+        """
+        if not os.path.isfile(path):  # Removed or renamed while settling
+            return False
+
+        destination = os.path.join(self.output_directory, os.path.basename(path))
+        partial = destination + ".part"
+        try:
+            before = os.stat(path)
+            self.secauax.encrypt_file(path, partial)
+            os.replace(partial, destination)
+
+            if self.remove_original:
+                after = os.stat(path)
+                if (before.st_size, before.st_mtime_ns) == (after.st_size, after.st_mtime_ns):
+                    os.remove(path)
+                else:  # Still being written, it will be encrypted again when it settles
+                    logger.warning(f"{path} changed while encrypting, the original was kept")
+
+        except Exception as E:
+            logger.error(f"Couldn't encrypt {path}: {type(E).__name__}: {E}")
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(partial)
+            return False
+
+        logger.info(f"Encrypted {path} -> {destination}")
+        return True
+
+
+def main() -> None:
+    """Run the watcher from the command line"""
+    parser = argparse.ArgumentParser(description="Encrypt every new file dropped into a directory.")
+    parser.add_argument("input_directory", help="directory to watch")
+    parser.add_argument("output_directory", help="directory to save the encrypted files")
+    key_group = parser.add_mutually_exclusive_group(required=True)
+    key_group.add_argument("--key", help="path to the key file")
+    key_group.add_argument("--passphrase", action="store_true", help="derive the key from a passphrase (prompted)")
+    parser.add_argument("--extension", default="*", help='filter files by extension: "*.png" / "*.txt" / ...')
+    parser.add_argument("--remove-original", action="store_true", help="remove the plaintext after encrypting")
+    parser.add_argument("--settle-time", type=float, default=2.0, help="seconds without changes before encrypting")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker threads")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    secauax = Secauax()
+    try:
+        if args.key:
+            secauax.load_key_into_class(args.key)
+        else:
+            secauax.set_passphrase(getpass.getpass("Passphrase: "))
+        Fernet(secauax.key)  # Check the key before watching
+    except OSError as E:
+        parser.error(f"couldn't read the key: {E}")
+    except ValueError:
+        parser.error("invalid Fernet key: Fernet key must be 32 url-safe base64-encoded bytes")
+
+    try:
+        watcher = FolderWatcher(secauax, args.input_directory, args.output_directory,
+                                file_extension=args.extension,
+                                remove_original=args.remove_original,
+                                settle_time=args.settle_time,
+                                workers=args.workers)
+    except Exit as E:
+        if E.exitcode == Exit.SameDirectory:
+            parser.error("the output directory must be different from the input directory")
+        parser.error("path to directory not found")
+
+    # Finish the current batch before exiting
+    signal.signal(signal.SIGINT, lambda signum, frame: watcher.stop())
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    watcher.run()
+
+
+if __name__ == "__main__":
+    main()
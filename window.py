@@ -1,27 +1,41 @@
 import glob
-import multiprocessing
 import os
 import random
 import string
 import sys
 import tempfile
-import threading
-import webbrowser
 from pathlib import Path
 from typing import Any, Callable, Union
 
 from PyQt5 import QtGui
 from PyQt5.QtWidgets import QMainWindow, QApplication, QFileDialog, QMessageBox
-from PyQt5.uic import loadUi
-from cryptography.fernet import InvalidToken
 
 from exceptions import Exit
 import callable
 from callable import resource_path
-from secauax import Secauax
 
+# The cryptography backend (secauax) and webbrowser are imported on first use to keep the startup fast
 
-class MainWindow(QMainWindow):
+try:
+    # UI and resources compiled by "python build.py ui"
+    from ui_main import Ui_MainWindow
+    import images_rc  # noqa: F401
+
+    PREVIEW_IMAGE = ":/images/Images/preview.png"
+    WINDOW_ICON = ":/images/icon.ico"
+
+except ImportError:
+    # Not compiled, parse the .ui file at runtime
+    class Ui_MainWindow:
+        def setupUi(self, main_window):
+            from PyQt5.uic import loadUi
+            loadUi(resource_path("resources/main.ui"), main_window)
+
+    PREVIEW_IMAGE = "resources/preview.png"
+    WINDOW_ICON = "resources/icon.ico"
+
+
+class MainWindow(QMainWindow, Ui_MainWindow):
     """Window functionality class
     """
 
@@ -34,22 +48,24 @@ class MainWindow(QMainWindow):
         # Last previewed image
         # (only for decrypted files, which are saved in the temp folder)
         self.last_preview_img = None
+        # Salt used for passphrase keys during this session
+        # (a single salt lets the KDF run only once per passphrase)
+        self.passphrase_salt = None
         self.preview_folder_images = []
         # Image filename to display
         # Default image -> preview.png
-        self.current_image_path = "resources/preview.png"
+        self.current_image_path = PREVIEW_IMAGE
 
         # Set Window settings
-        print(resource_path("callable.py"))
-        loadUi(resource_path("resources/main.ui"), self)
+        self.setupUi(self)
         self.setWindowTitle("SecAuax")
-        self.setWindowIcon(QtGui.QIcon(resource_path("resources/icon.ico")))
+        self.setWindowIcon(QtGui.QIcon(resource_path(WINDOW_ICON)))
 
         # Connect Menu
         self.clear_log.triggered.connect(self.reset_logger)
-        self.open_github.triggered.connect(lambda: webbrowser.open("https://github.com/auax"))
-        self.report_issue.triggered.connect(lambda: webbrowser.open("https://github.com/auax/secauax/issues/new"))
-        self.donate.triggered.connect(lambda: webbrowser.open("https://paypal.me/zellius"))
+        self.open_github.triggered.connect(lambda: MainWindow.open_url("https://github.com/auax"))
+        self.report_issue.triggered.connect(lambda: MainWindow.open_url("https://github.com/auax/secauax/issues/new"))
+        self.donate.triggered.connect(lambda: MainWindow.open_url("https://paypal.me/zellius"))
 
         # Connect First Section (input path)
         self.browse_file_inp_btn.clicked.connect(lambda: self.browse_file(False,
@@ -90,6 +106,11 @@ class MainWindow(QMainWindow):
                                                                           check_config=True,
                                                                           qlabel=self.load_key_path))
 
+        # On enable "passphrase" checkbox
+        self.passphrase_cb.stateChanged.connect(lambda: MainWindow.key_mode(self.passphrase_cb,
+                                                                           self.passphrase_input,
+                                                                           self.passphrase_input))
+
         # Last section (encrypt and decrypt buttons)
         self.encrypt_btn.clicked.connect(self.encrypt)
         self.decrypt_btn.clicked.connect(self.decrypt)
@@ -128,13 +149,26 @@ class MainWindow(QMainWindow):
         except:
             pass
 
+    @staticmethod
+    def open_url(url: str) -> None:
+        """
+        Open a URL in the default web browser
+        :param url: the URL to open
+        :return: None
+        """
+        import webbrowser
+        webbrowser.open(url)
+
     def decrypt_and_load_img(self, path: Union[str, Path]):
+        from secauax import Secauax
+
         try:
             if self.last_preview_img:
                 os.remove(self.last_preview_img)
 
             secauax = Secauax()
-            secauax.load_key_into_class(self.image_key_path.text())
+            if not self.apply_passphrase(secauax):
+                secauax.load_key_into_class(self.image_key_path.text())
             filename = os.path.join(tempfile.gettempdir(),
                                     "".join(random.choices(string.ascii_lowercase, k=20)))
             secauax.decrypt_file(path, filename)
@@ -285,6 +319,23 @@ class MainWindow(QMainWindow):
             self.encrypt_btn.setEnabled(False)
             self.decrypt_btn.setEnabled(False)
 
+    def apply_passphrase(self, secauax: Any) -> bool:
+        """
+        Set the passphrase of a Secauax instance from the passphrase input, if it's set.
+        The derived keys are cached, so the KDF only runs once per passphrase in a session.
+        :param secauax: Secauax instance
+        :return: bool
+        """
+        if not self.passphrase_input.text():
+            return False
+
+        from secauax import SALT_SIZE
+
+        if self.passphrase_salt is None:
+            self.passphrase_salt = os.urandom(SALT_SIZE)
+        secauax.set_passphrase(self.passphrase_input.text(), salt=self.passphrase_salt)
+        return True
+
     @staticmethod
     def key_mode(this_checkbox, to_clear, to_enable) -> None:
         """
@@ -304,10 +355,16 @@ class MainWindow(QMainWindow):
         Encrypt using the Secauax.encrypt_file or Secauax.bulk_encrypt methods.
         :return: None
         """
+        from cryptography.fernet import InvalidToken
+        from secauax import Secauax
 
         try:
             secauax = Secauax()  # Class instance
 
+            if self.passphrase_input.text() and (self.save_key_path.text() or self.load_key_path.text()):
+                # The passphrase would replace the saved or loaded key
+                raise Exit(Exit.KeyModeError)
+
             if self.save_key_path.text():
                 # Save key to the desired path
                 secauax.save_key(self.save_key_path.text())
@@ -318,6 +375,9 @@ class MainWindow(QMainWindow):
                 secauax.load_key_into_class(self.load_key_path.text())
                 self.logger(f"Key path set to: {self.load_key_path.text()}!")
 
+            if self.apply_passphrase(secauax):
+                self.logger("Passphrase set!")
+
             if self.mode_cb.isChecked():
                 # Directory mode
                 if not secauax.bulk_encrypt(self.input_path.text(), self.output_path.text()):
@@ -326,7 +386,8 @@ class MainWindow(QMainWindow):
                 # File mode
                 secauax.encrypt_file(self.input_path.text(), self.output_path.text())
 
-            self.logger(f"Used key: {secauax.key.decode()}")
+            if not secauax.passphrase_:  # Passphrase keys are derived per file
+                self.logger(f"Used key: {secauax.key.decode()}")
             self.logger(f"File(s) successfully encrypted in {self.output_path.text()}!")
 
             # Show a message
@@ -349,6 +410,9 @@ class MainWindow(QMainWindow):
                 elif exitcode == 2:
                     self.logger("Path to directory not found!", "red")
 
+                elif exitcode == 3:
+                    self.logger("Use either a passphrase or a key file, not both!", "red")
+
             else:
                 self.logger(f"Unhandled error: {type(E).__name__}", "red")
 
@@ -357,10 +421,16 @@ class MainWindow(QMainWindow):
         Decrypt using the Secauax.decrypt_file or Secauax.bulk_decrypt methods.
         :return: None
         """
+        from cryptography.fernet import InvalidToken
+        from secauax import Secauax
 
         try:
             secauax = Secauax()  # Class instance
 
+            if self.passphrase_input.text() and (self.save_key_path.text() or self.load_key_path.text()):
+                # The passphrase would replace the saved or loaded key
+                raise Exit(Exit.KeyModeError)
+
             if self.save_key_path.text():
                 # Save key to the desired path
                 secauax.save_key(self.save_key_path.text())
@@ -371,6 +441,9 @@ class MainWindow(QMainWindow):
                 secauax.load_key_into_class(self.load_key_path.text())
                 self.logger(f"Key path set to: {self.load_key_path.text()}!")
 
+            if self.apply_passphrase(secauax):
+                self.logger("Passphrase set!")
+
             if self.mode_cb.isChecked():
                 # Directory mode
                 if not secauax.bulk_decrypt(self.input_path.text(), self.output_path.text()):
@@ -379,7 +452,8 @@ class MainWindow(QMainWindow):
                 # File mode
                 secauax.decrypt_file(self.input_path.text(), self.output_path.text())
 
-            self.logger(f"Used key: {secauax.key.decode()}")
+            if not secauax.passphrase_:  # Passphrase keys are derived per file
+                self.logger(f"Used key: {secauax.key.decode()}")
             self.logger(f"File(s) successfully decrypted in {self.output_path.text()}!")
 
             # Show message
@@ -402,6 +476,9 @@ class MainWindow(QMainWindow):
                 elif exitcode == 2:
                     self.logger("Path to directory not found!", "red")
 
+                elif exitcode == 3:
+                    self.logger("Use either a passphrase or a key file, not both!", "red")
+
             else:
                 self.logger(f"Unhandled error: {type(E).__name__}", "red")
                 raise E
@@ -432,15 +509,20 @@ class MainWindow(QMainWindow):
         self.log.setHtml("")
 
 
-# Run app
-app = QApplication(sys.argv)
-main_window = MainWindow()
+def main() -> None:
+    """Run app"""
+    app = QApplication(sys.argv)
+    main_window = MainWindow()
+
+    screen_size = app.primaryScreen().size()
+    rw, rh = screen_size.width(), screen_size.height()  # Current screen resolution
+    w = int(rw * 1450 / 1920)
+    h = int(rh * 930 / 1080)
+
+    main_window.setMinimumSize(w, h)
+    main_window.show()
+    sys.exit(app.exec())
 
-screen_size = app.primaryScreen().size()
-rw, rh = screen_size.width(), screen_size.height()  # Current screen resolution
-w = int(rw * 1450 / 1920)
-h = int(rh * 930 / 1080)
 
-main_window.setMinimumSize(w, h)
-main_window.show()
-sys.exit(app.exec())
+if __name__ == "__main__":
+    main()